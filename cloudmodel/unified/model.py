@@ -4,28 +4,39 @@ This module implements the base dataclasses which define a problem to be solved
 the solution
 """
 
-from dataclasses import dataclass
-from typing import Tuple
-from ..util import simplified_repr
+from dataclasses import field
+from typing import Sequence, Tuple
+from ..util import cached_hash, interned, opt_frozen_dataclass, simplified_repr
 from .. import __version__
 from .units import *
+from .units import convert, ureg
 
 
 @simplified_repr("name", show_field_names=False)
-@dataclass(frozen=True)
+@cached_hash
+@interned
+@opt_frozen_dataclass
 class App:
     """App identifier.
 
+    Apps are interned: creating an App with the same name and max_resp_time as a recently created
+    one usually returns the same object, so comparisons of apps used as dict keys mostly reduce to
+    an identity check. This is not guaranteed (e.g. old apps are forgotten, and nothing is
+    interned under ``python -O``), so apps must still be compared with ``==``.
+
     Attributes:
       - name:str: name of the application
+      - max_resp_time:Time: maximum response time of the application
     """
 
     name: str = "unnamed"
     max_resp_time: Time = UNLIMITED_TIME
+    _hash: int | None = field(default=None, init=False, repr=False, compare=False)
 
 
 @simplified_repr("name", show_field_names=False)
-@dataclass(frozen=True)
+@cached_hash
+@opt_frozen_dataclass
 class Region:
     """Region identifier.
 
@@ -34,10 +45,11 @@ class Region:
     """
 
     name: str = "unnamed region"
+    _hash: int | None = field(default=None, init=False, repr=False, compare=False)
 
 
 @simplified_repr("description", "time_slot_size")
-@dataclass(frozen=True)
+@opt_frozen_dataclass
 class WorkloadSeries:
     """Workload as a sequence for different timeslots
 
@@ -62,7 +74,7 @@ class WorkloadSeries:
 
 
 @simplified_repr("value", "time_slot_size")
-@dataclass(frozen=True)
+@opt_frozen_dataclass
 class Workload:
     """
     Workload for a single timeslot (to be deprecated, redundant with WorkloadSeries)
@@ -84,10 +96,16 @@ class Workload:
 
 
 @simplified_repr("name", "max_vms", "max_cores")
-@dataclass(frozen=True)
+@cached_hash
+@interned
+@opt_frozen_dataclass
 class LimitingSet:
     """LimitingSet restrictions.
 
+    Limiting sets are shared by many instance classes and are part of their hash, so they are
+    interned as apps are: creating a LimitingSet equal to a recently created one usually returns
+    the same object.
+
     Attributes:
       - name:str: name of this limiting set (usually a region name)
       - max_vms:int: limit of the maximum number of VMs that can be running in this limiting set.
@@ -99,10 +117,12 @@ class LimitingSet:
     name: str
     max_vms: int = 0
     max_cores: ComputationalUnits = ComputationalUnits("0 cores")
+    _hash: int | None = field(default=None, init=False, repr=False, compare=False)
 
 
 @simplified_repr("name", "price", "cores", "mem")
-@dataclass(frozen=True)
+@cached_hash
+@opt_frozen_dataclass(kw_only=True)
 class InstanceClass:
     """InstanceClass characterization
 
@@ -128,6 +148,7 @@ class InstanceClass:
     is_reserved: bool = False
     is_private: bool = False
     region: Region = Region("__world__")
+    _hash: int | None = field(default=None, init=False, repr=False, compare=False)
 
     # def __post_init__(self):
     #     """Checks dimensions are valid and store them in the standard units."""
@@ -137,7 +158,7 @@ class InstanceClass:
 
 
 @simplified_repr("value")
-@dataclass(frozen=True)
+@opt_frozen_dataclass
 class Latency:
     """
     Attributes:
@@ -148,7 +169,8 @@ class Latency:
 
 
 @simplified_repr("name", "cores", "mem", "app", "limit")
-@dataclass(frozen=True)
+@cached_hash
+@opt_frozen_dataclass(kw_only=True)
 class ContainerClass:
     """ContainerClass characterization
 
@@ -165,6 +187,7 @@ class ContainerClass:
     mem: Storage
     app: App
     limit: int
+    _hash: int | None = field(default=None, init=False, repr=False, compare=False)
 
     # def __post_init__(self):
     #     """Checks dimensions are valid and store them in the standard units."""
@@ -172,7 +195,8 @@ class ContainerClass:
     #     object.__setattr__(self, "mem", self.mem.to("gibibytes"))
 
 
-@dataclass(frozen=True)
+@cached_hash
+@opt_frozen_dataclass(kw_only=True)
 class ProcessClass:
     """Running process characterization (TODO: same than ContainerClass?)
 
@@ -189,10 +213,11 @@ class ProcessClass:
     mem: Storage
     app: App
     limit: int
+    _hash: int | None = field(default=None, init=False, repr=False, compare=False)
 
 
 @simplified_repr("value", "slo95")
-@dataclass(frozen=True)
+@opt_frozen_dataclass
 class Performance:
     """
     Model for the performance of a given application running on a given infrastructure. The
@@ -212,15 +237,24 @@ class Performance:
     # slot size (or perhaps the time slot divided by the number of requests?) TODO: Think about this
 
 
+# Performance indexes of a System, by instance class and by application
+_PerfsByIc = dict[
+    InstanceClass, dict[Tuple[ContainerClass | ProcessClass | None, App], Performance]
+]
+_PerfsByApp = dict[
+    App, dict[Tuple[InstanceClass, ContainerClass | ProcessClass | None], Performance]
+]
+
+
 @simplified_repr("name")
-@dataclass(frozen=True)
+@opt_frozen_dataclass
 class System:
     """Model for the system, infrastructure and apps
 
     Attributes:
       - name:str: name of the system
-      - ics:list[InstanceClass]: list of instance classes
-      - ccs:list[ContainerClass]: list of container classes
+      - ics:Sequence[InstanceClass]: instance classes (stored as a tuple)
+      - ccs:Sequence[ContainerClass]: container classes (stored as a tuple)
       - perfs:dict[Tuple[InstanceClass, ContainerClass | ProcessClass | None, App], Performance]:
             performance of each application running on each instance class or container class
       - latencies:dict[Tuple[Region, Region], Latency]: latency between regions
@@ -229,25 +263,61 @@ class System:
     """
 
     name: str
-    ics: list[InstanceClass]
-    ccs: list[ContainerClass]
+    ics: Sequence[InstanceClass]
+    ccs: Sequence[ContainerClass]
     perfs: dict[
         Tuple[InstanceClass, ContainerClass | ProcessClass | None, App],
         Performance,
     ]
     latencies: dict[Tuple[Region, Region], Latency]
     default_latency: Latency = Latency(Time("0 s"))
+    _perfs_by_ic: _PerfsByIc | None = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    _perfs_by_app: _PerfsByApp | None = field(
+        default=None, init=False, repr=False, compare=False
+    )
 
-    # def __post_init__(self):
-    #     """Checks dimensions are valid and store them in the standard units."""
-    #     new_perfs = {}
-    #     for key, value in self.perfs.items():
-    #         new_perfs[key] = value.to("req/hour")
-    #     object.__setattr__(self, "perfs", new_perfs)
+    def __post_init__(self):
+        """Stores ics and ccs as tuples, since the system is immutable."""
+        object.__setattr__(self, "ics", tuple(self.ics))
+        object.__setattr__(self, "ccs", tuple(self.ccs))
+
+    def perfs_for_ic(
+        self, ic: InstanceClass
+    ) -> dict[Tuple[ContainerClass | ProcessClass | None, App], Performance]:
+        """Returns the performances of all the applications running on the given instance class,
+        as a dict indexed by (cc, app). The returned dict is shared and must not be modified."""
+        by_ic = self._perfs_by_ic
+        if by_ic is None:
+            by_ic, _ = self._build_perfs_indexes()
+        return by_ic.get(ic, {})
+
+    def perfs_for_app(
+        self, app: App
+    ) -> dict[Tuple[InstanceClass, ContainerClass | ProcessClass | None], Performance]:
+        """Returns the performances of the given application on all the instance classes, as
+        a dict indexed by (ic, cc). The returned dict is shared and must not be modified."""
+        by_app = self._perfs_by_app
+        if by_app is None:
+            _, by_app = self._build_perfs_indexes()
+        return by_app.get(app, {})
+
+    def _build_perfs_indexes(self) -> Tuple[_PerfsByIc, _PerfsByApp]:
+        # Both indexes are built in a single pass over perfs, the first time any of them is
+        # needed. There is no need for invalidation, since the system is immutable
+        by_ic: _PerfsByIc = {}
+        by_app: _PerfsByApp = {}
+        for (ic, cc, app), perf in self.perfs.items():
+            by_ic.setdefault(ic, {})[cc, app] = perf
+            by_app.setdefault(app, {})[ic, cc] = perf
+        object.__setattr__(self, "_perfs_by_ic", by_ic)
+        object.__setattr__(self, "_perfs_by_app", by_app)
+        return by_ic, by_app
 
 
 @simplified_repr("name", "system", "version")
-@dataclass(frozen=True)
+@opt_frozen_dataclass
 class Problem:
     """Problem description.
 
@@ -275,44 +345,56 @@ class Problem:
 def workloadSeries_scale(
     wl_series: WorkloadSeries, to: Time = Time("1 minute")
 ) -> WorkloadSeries:
+    if wl_series.time_slot_size.units == to.units:
+        # Already in the requested units, and the series is immutable
+        return wl_series
     return WorkloadSeries(
-        wl_series.description,
-        wl_series.values,
-        wl_series.time_slot_size.to(to),
-        wl_series.intra_slot_distribution,
+        description=wl_series.description,
+        values=wl_series.values,
+        time_slot_size=convert(wl_series.time_slot_size, to.units),
+        intra_slot_distribution=wl_series.intra_slot_distribution,
     )
 
 
 def normalize_time_units(problem: Problem, units: str = "minute") -> Problem:
-    sched_time_size = problem.sched_time_size.to(units)
+    # Resolve the target units once, instead of parsing the unit strings on each conversion.
+    # Conversions use convert(), which multiplies by a conversion factor cached per pair of units
+    time_unit = ureg.Unit(units)
+    price_unit = ureg.Unit(f"usd/{units}")
+    perf_unit = ureg.Unit(f"req/{units}")
+    sched_time_size = convert(problem.sched_time_size, time_unit)
+    slot_time = Time(units)
     workloads = {}
     for (app, region), wl_series in problem.workloads.items():
-        workloads[app, region] = workloadSeries_scale(wl_series, to=Time(units))
-    ics = []
-    for ic in problem.system.ics:
-        ics.append(
-            InstanceClass(
-                name=ic.name,
-                price=ic.price.to(f"usd/{units}"),
-                cores=ic.cores,
-                mem=ic.mem,
-                limit=ic.limit,
-                limiting_sets=ic.limiting_sets,
-                is_reserved=ic.is_reserved,
-                is_private=ic.is_private,
-            )
+        workloads[app, region] = workloadSeries_scale(wl_series, to=slot_time)
+    ics = tuple(
+        InstanceClass(
+            name=ic.name,
+            price=convert(ic.price, price_unit),
+            cores=ic.cores,
+            mem=ic.mem,
+            limit=ic.limit,
+            limiting_sets=ic.limiting_sets,
+            is_reserved=ic.is_reserved,
+            is_private=ic.is_private,
         )
-    perfs = {}
-    for k, v in problem.system.perfs.items():
-        ic, cc, app = k
-        ic_idx = problem.system.ics.index(ic)
-        perfs[ics[ic_idx], cc, app] = Performance(
-            value=v.value.to(f"req/{units}"), slo95=v.slo95.to(units)
+        for ic in problem.system.ics
+    )
+    # Map each original instance class to its normalized version. The hash of instance classes is
+    # cached, and dict lookups check identity before equality, so this is as cheap as a map keyed
+    # by id() but also works for keys which are equal to, but not the same object as, an
+    # instance class of the system
+    ic_map = dict(zip(problem.system.ics, ics))
+    perfs = {
+        (ic_map[ic], cc, app): Performance(
+            value=convert(v.value, perf_unit), slo95=convert(v.slo95, time_unit)
         )
-    lats = {}
+        for (ic, cc, app), v in problem.system.perfs.items()
+    }
+    lats: dict = {}
     for k_, v_ in problem.system.latencies.items():
         r1, r2 = k_
-        lats[r1, r2] = v_.value.to(f"{units}")
+        lats[r1, r2] = convert(v_.value, time_unit)
     sys = System(
         name=problem.system.name,
         ics=ics,
@@ -1,7 +1,9 @@
-from pint import DimensionalityError, UnitRegistry
+import math
+from functools import lru_cache
+from pint import DimensionalityError, Unit, UnitRegistry
 from pint.facets.plain import PlainQuantity as Quantity
 from pint.testing import assert_allclose as assert_approx
-from typing import Union, cast
+from typing import TypeVar, Union, cast
 
 # Define new units
 ureg = UnitRegistry()
@@ -16,22 +18,91 @@ ureg.define("rpm = req/minute")
 ureg.define("rph = req/hour")
 
 
+def assert_approx_magnitudes(a: float, b: float, rel: float = 1e-9) -> None:
+    """Assert that two magnitudes, already expressed in the same units, are approximately equal.
+
+    It is a cheaper alternative to assert_approx when the units are known, since no unit conversion
+    is involved."""
+    if not math.isclose(a, b, rel_tol=rel):
+        raise AssertionError(f"{a} and {b} are not close (relative tolerance {rel})")
+
+
+@lru_cache(maxsize=4096)
+def _parse_quantity(v: str):
+    # Parsing a quantity string goes through pint's tokenizer, which is slow, and the same strings
+    # ("1 hour", "0 cores"...) are used over and over. The magnitude and units are cached instead
+    # of the Quantity itself, because quantities are mutable (e.g. through ito())
+    q = ureg.Quantity(v)
+    return q.magnitude, q._units
+
+
+@lru_cache(maxsize=1024)
+def _parse_units(units: str) -> Unit:
+    # Units given separately from the magnitude come from a small set of strings ("hour",
+    # "usd/hour", ...), so each one is parsed only once. Units are immutable, so they can be shared
+    return ureg.parse_units(units)
+
+
+@lru_cache(maxsize=None)
+def _conversion_factor(src, dst) -> float:
+    # pint converts multiplicative units as value * factor, so converting 1.0 gives the factor
+    return ureg.Quantity(1.0, src).to(dst).magnitude
+
+
+_Q = TypeVar("_Q", bound=Quantity)
+
+
+def convert(quantity: _Q, unit: Unit) -> _Q:
+    """Convert quantity to the given unit, with the same result as quantity.to(unit).
+
+    The conversion factor between each pair of units is computed by pint only the first time, so
+    each conversion is just a multiplication. Only valid for multiplicative units, which are
+    the only ones used in the model. As in pint, the magnitude is kept unchanged (e.g. it stays
+    an int) if the quantity is already in the given unit."""
+    if quantity._units == unit._units:
+        return cast(_Q, ureg.Quantity(quantity.magnitude, unit._units))
+    factor = _conversion_factor(quantity._units, unit._units)
+    return cast(_Q, ureg.Quantity(quantity.magnitude * factor, unit._units))
+
+
 class CheckedDimensionality(Quantity):
     _my_dimensionality = "[]"
+    _my_dimensionality_obj = ureg.get_dimensionality("[]")
+    _checked_units: set = set()
 
     def __init_subclass__(cls, dimensionality="[]", **kwargs):
         # This function is called when this class is subclassed
-        # We store the dimensionality value in the subclass
+        # We store the dimensionality value in the subclass (also parsed, so that it is not
+        # parsed again on each check), and a set of the units which are already known to have
+        # that dimensionality
         super().__init_subclass__(**kwargs)
         cls._my_dimensionality = dimensionality
+        cls._my_dimensionality_obj = ureg.get_dimensionality(dimensionality)
+        cls._checked_units = set()
 
-    def __new__(cls, v: Union[str, Quantity]) -> "CheckedDimensionality":
+    def __new__(
+        cls, v: Union[str, float, Quantity], units: Union[str, Unit, None] = None
+    ) -> "CheckedDimensionality":
         # This method will be inherited by the subclasses and used to
         # create obejects of that subclass. During the creation,
-        # the correct dimensionality is checked
-        obj = ureg.Quantity(v)  # type: ignore
-        if not obj.check(cls._my_dimensionality):
-            raise DimensionalityError(v, cls._my_dimensionality)
+        # the correct dimensionality is checked. The quantity can be given as a single string
+        # or Quantity, or as a magnitude and its units
+        if units is not None:
+            if isinstance(units, str):
+                units = _parse_units(units)
+            obj = ureg.Quantity(v, units)
+        elif isinstance(v, ureg.Quantity) and v._units in cls._checked_units:
+            # Fast path: v already has valid units, so the check is skipped. A new quantity is
+            # still returned, since quantities are mutable and v must not be shared
+            return ureg.Quantity(v.magnitude, v._units)
+        elif isinstance(v, str):
+            obj = ureg.Quantity(*_parse_quantity(v))
+        else:
+            obj = ureg.Quantity(v)  # type: ignore
+        if obj._units not in cls._checked_units:
+            if obj.dimensionality != cls._my_dimensionality_obj:
+                raise DimensionalityError(v, cls._my_dimensionality)
+            cls._checked_units.add(obj._units)
         return obj
 
 
@@ -1,36 +1,218 @@
 """Internal utility functions"""
 
 
+from dataclasses import dataclass, fields
+from functools import lru_cache, wraps
+from typing import TYPE_CHECKING
+
 from .unified.units import Quantity
 
 
-def repr_attr(obj, attr, show_field_names=True):
-    if show_field_names:
-        value = getattr(obj, attr)
-        if isinstance(value, Quantity):
-            return f"{attr}='{str(value)}'"
-        else:
-            return f"{attr}={repr(value)}"
-    else:
-        return repr(getattr(obj, attr))
+@lru_cache(maxsize=1024, typed=True)
+def _quantity_repr(cls, magnitude, units, default_format, *registry_formats):
+    # registry_formats are not used, but they are part of the cache key, since the registry
+    # settings also affect how the quantity is formatted
+    quantity = cls(magnitude, units)
+    quantity.default_format = default_format
+    return f"'{quantity}'"
+
+
+def _repr_value(value):
+    if isinstance(value, Quantity):
+        magnitude = value.magnitude
+        registry = value._REGISTRY
+        # Formatting quantities is slow, and the same ones are shown over and over, so the result
+        # is memoized for scalar magnitudes. Zero is excluded, since 0.0 and -0.0 share a cache key.
+        # Localized formatting is not memoized, since it depends on the babel configuration too
+        if (
+            type(magnitude) in (int, float)
+            and magnitude
+            and registry.fmt_locale is None
+        ):
+            return _quantity_repr(
+                type(value),
+                magnitude,
+                value._units,
+                value.default_format,
+                registry.default_format,
+                registry.separate_format_defaults,
+            )
+        return f"'{value}'"
+    return repr(value)
 
 
 def simplified_repr(*fields, show_field_names=True):
-    """This decorator modifies the default __repr__ of namedtuples to show
+    """This decorator modifies the default __repr__ of dataclasses to show
     only the class name and the selected fields as parameters, instead
-    of all fields
+    of all fields.
+
+    As dataclasses do, the source of __repr__ is generated once for the class and compiled with
+    exec, so that each call is a single f-string with direct attribute accesses.
     """
 
     def decorator(cls):
         args = [f for f in fields if f in cls.__dataclass_fields__]
-        cls.__repr__ = (
-            lambda self: f"{cls.__name__}({', '.join(repr_attr(self, f, show_field_names) for f in args)})"
-        )
+        if show_field_names:
+            parts = [f"{f}={{_repr_value(self.{f})}}" for f in args]
+        else:
+            parts = [f"{{self.{f}!r}}" for f in args]
+        src = f'def __repr__(self):\n    return f"{cls.__name__}({", ".join(parts)})"\n'
+        namespace = {"_repr_value": _repr_value}
+        exec(src, namespace)
+        __repr__ = namespace["__repr__"]
+        __repr__.__qualname__ = f"{cls.__qualname__}.__repr__"
+        cls.__repr__ = __repr__
         return cls
 
     return decorator
 
 
+if TYPE_CHECKING:
+    # Type checkers only recognize dataclasses created through the decorators they know
+    from dataclasses import dataclass as opt_frozen_dataclass
+else:
+
+    def opt_frozen_dataclass(cls=None, /, **kwargs):
+        """Slotted dataclass which is frozen only when assertions are enabled.
+
+        Under tests and development (``__debug__`` is True) the class is frozen, so accidental
+        mutations are caught. Under ``python -O`` the frozen ``__setattr__`` machinery is
+        dropped, which makes instantiation noticeably cheaper. Since a non-frozen dataclass with
+        ``eq=True`` is unhashable by default, ``unsafe_hash`` is enabled in that case so that the
+        instances can still be used as dict keys.
+
+        It can be used as ``@opt_frozen_dataclass`` or ``@opt_frozen_dataclass(**kwargs)``, where
+        ``kwargs`` are passed through to ``dataclass``. Code which needs to set attributes after
+        creation (e.g. in ``__post_init__``) must use ``object.__setattr__`` to work in both
+        modes. Type checkers see it as ``dataclasses.dataclass``.
+        """
+        kwargs.setdefault("frozen", __debug__)
+        kwargs.setdefault("unsafe_hash", not kwargs["frozen"])
+        kwargs.setdefault("slots", True)
+        kwargs.setdefault("eq", True)
+
+        def decorator(cls):
+            return dataclass(cls, **kwargs)
+
+        if cls is None:
+            return decorator
+        return decorator(cls)
+
+
+def cached_hash(cls):
+    """This decorator makes the dataclass-generated __hash__ compute its value only once.
+
+    Model objects are used as (parts of) dict keys, and hashing them requires hashing all their
+    fields, including pint quantities, whose hash involves a conversion to base units. The class
+    must declare a ``_hash`` field with ``init=False, compare=False`` and default ``None``, in
+    which the value is stored on first use. The cached value is not pickled, since the hash of
+    strings changes between interpreter runs. Non-frozen classes (as produced by
+    ``opt_frozen_dataclass`` under ``python -O``) are left untouched, since a mutation would
+    make the cached value stale.
+    """
+    if not cls.__dataclass_params__.frozen:
+        return cls
+
+    fields_hash = cls.__hash__
+
+    def __hash__(self):
+        h = self._hash
+        if h is None:
+            h = fields_hash(self)
+            object.__setattr__(self, "_hash", h)
+        return h
+
+    def __getstate__(self):
+        return [
+            None if f.name == "_hash" else getattr(self, f.name) for f in fields(self)
+        ]
+
+    def __setstate__(self, state):
+        for f, value in zip(fields(self), state):
+            object.__setattr__(self, f.name, value)
+
+    cls.__hash__ = __hash__
+    cls.__getstate__ = __getstate__
+    cls.__setstate__ = __setstate__
+    return cls
+
+
+def _intern_key(value):
+    # Quantities are keyed by their exact magnitude and units, instead of by the quantity, so that
+    # equal values expressed in different units are not merged into the same object. The type of
+    # each value is part of the key too, so that e.g. 10 and 10.0 or 1 and True are not merged
+    if isinstance(value, Quantity):
+        return (type(value.magnitude), value.magnitude, value._units)
+    return (type(value), value)
+
+
+def _reconstruct(cls, kwargs):
+    return cls(**kwargs)
+
+
+def interned(cls=None, /, *, maxsize=4096):
+    """This decorator makes a dataclass return the same object for instances with the same fields.
+
+    Comparing interned objects used as dict keys reduces to an identity check. The dataclass
+    ``__init__`` runs on a new object, which is then replaced by the previously created one with
+    the same fields, if any, so shared instances are never modified. Only the ``maxsize`` most
+    recently interned objects are remembered; older ones are still valid, just no longer reused.
+    Instances with unhashable fields are not interned. Pickling and copying go through the
+    constructor, so they also return the interned object. Non-frozen classes (as produced by
+    ``opt_frozen_dataclass`` under ``python -O``) are left untouched, since a mutation of a shared
+    instance would affect every later construction.
+
+    It can be used as ``@interned`` or ``@interned(maxsize=n)``, and must be applied after the
+    class is made a dataclass.
+    """
+
+    def decorator(cls):
+        if not cls.__dataclass_params__.frozen:
+            return cls
+
+        instances = {}
+        init = cls.__init__
+        init_fields = tuple(f.name for f in fields(cls) if f.init)
+
+        @wraps(init)
+        def __new__(cls_, *args, **kwargs):
+            instance = object.__new__(cls_)
+            init(instance, *args, **kwargs)
+            try:
+                key = (cls_,) + tuple(
+                    _intern_key(getattr(instance, name)) for name in init_fields
+                )
+                return instances[key]
+            except TypeError:
+                return instance
+            except KeyError:
+                pass
+            instances[key] = instance
+            if len(instances) > maxsize:
+                del instances[next(iter(instances))]
+            return instance
+
+        @wraps(init)
+        def __init__(self, *args, **kwargs):
+            # Already initialized by __new__
+            pass
+
+        def __reduce__(self):
+            return _reconstruct, (
+                type(self),
+                {name: getattr(self, name) for name in init_fields},
+            )
+
+        cls.__new__ = staticmethod(__new__)
+        cls.__init__ = __init__
+        cls.__reduce__ = __reduce__
+        return cls
+
+    if cls is None:
+        return decorator
+    return decorator(cls)
+
+
 # class MyTuple(tuple[float, ...]):
 #     """Custom version of tuple which is represented as Tuple[n] in output, instead of (x,x,x,x,x....)"""
 
@@ -2,7 +2,9 @@
 Define strategies for generating quantities with the appropriate units and to generate random
 problems which have a consistent set of apps, ics and ccs, for use via hypothesis package in testing
 """
+import functools
 import itertools
+import string
 from cloudmodel.unified.units import (
     Time,
     Currency,
@@ -15,69 +17,105 @@ from cloudmodel.unified.units import (
 from cloudmodel.unified import model
 from hypothesis import strategies as st
 
-# Function to create a string of the form "20.3 minute" for example The numeric part is drawn
-# randomly from floats, and the units part is drawn randomly from the given list f allowable units
-def str_float_quantity_strategy(
-    allowable_units: list[str], min_value=0, max_value=1e30
-):
-    value = st.floats(
+
+@functools.lru_cache(maxsize=None)
+def _float_strategy(min_value: float, max_value: float):
+    return st.floats(
         min_value=min_value,
         max_value=max_value,
         allow_nan=False,
         allow_subnormal=False,
         allow_infinity=False,
     )
-    unit = st.sampled_from(allowable_units)
-    return st.tuples(value, unit).map(lambda v: f"{v[0]} {v[1]}")
 
 
-def model_unit_strategy(t: type):
-    """Strategie to generate a random Quantity with the appropriate units depending
-    on the type received. For example, for Time type the quantity generated will be of the subclass
-    Time and the units will be time units, and so on."""
-    if t == Time:
-        return st.builds(
-            Time, str_float_quantity_strategy(["hour", "minute", "second"])
-        )
-    elif t == Currency:
-        return st.builds(Currency, str_float_quantity_strategy(["usd"]))
-    elif t == CurrencyPerTime:
-        return st.builds(
-            CurrencyPerTime,
-            str_float_quantity_strategy(["usd/hour", "usd/minute", "usd/second"]),
-        )
-    elif t == Requests:
-        return st.builds(Requests, str_float_quantity_strategy(["req"]))
-    elif t == RequestsPerTime:
-        return st.builds(
-            RequestsPerTime,
-            str_float_quantity_strategy(["req/hour", "req/minute", "req/second"]),
-        )
-    elif t == Storage:
-        return st.builds(Storage, str_float_quantity_strategy(["MiB", "GiB"]))
-    elif t == ComputationalUnits:
-        return st.builds(
-            ComputationalUnits, str_float_quantity_strategy(["cores", "millicores"])
-        )
-    else:
-        raise TypeError(f"Invalid type {t} for strategy")
+@functools.lru_cache(maxsize=None)
+def _units_strategy(allowable_units: tuple[str, ...]):
+    return st.sampled_from(allowable_units)
 
 
-# Register the previous function as strategy for our unit types
-st.register_type_strategy(Time, model_unit_strategy)
-st.register_type_strategy(Currency, model_unit_strategy)
-st.register_type_strategy(CurrencyPerTime, model_unit_strategy)
-st.register_type_strategy(Requests, model_unit_strategy)
-st.register_type_strategy(RequestsPerTime, model_unit_strategy)
-st.register_type_strategy(Storage, model_unit_strategy)
-st.register_type_strategy(ComputationalUnits, model_unit_strategy)
+# Function to create a tuple of the form (20.3, "minute") for example, to be passed as magnitude
+# and units to the quantity constructors, which avoids parsing a string. The numeric part is drawn
+# randomly from floats (within a realistic range by default, since huge magnitudes only make
+# generation and shrinking slower), and the units part is drawn randomly from the given list of
+# allowable units. The strategies for both parts are shared among all the calls with the same
+# bounds or units
+def float_quantity_args_strategy(
+    allowable_units: list[str], min_value=1e-6, max_value=1e6
+):
+    value = _float_strategy(min_value, max_value)
+    unit = _units_strategy(tuple(allowable_units))
+    return st.tuples(value, unit)
+
+
+# Strategies to generate a random Quantity with the appropriate units for each of our unit types.
+# They are built once at import time
+_UNIT_STRATEGIES = {
+    Time: float_quantity_args_strategy(["hour", "minute", "second"]).map(
+        lambda v: Time(*v)
+    ),
+    Currency: float_quantity_args_strategy(["usd"], max_value=1e3).map(
+        lambda v: Currency(*v)
+    ),
+    CurrencyPerTime: float_quantity_args_strategy(
+        ["usd/hour", "usd/minute", "usd/second"], max_value=1e3
+    ).map(lambda v: CurrencyPerTime(*v)),
+    Requests: float_quantity_args_strategy(["req"]).map(lambda v: Requests(*v)),
+    RequestsPerTime: float_quantity_args_strategy(
+        ["req/hour", "req/minute", "req/second"]
+    ).map(lambda v: RequestsPerTime(*v)),
+    Storage: float_quantity_args_strategy(["MiB", "GiB"]).map(lambda v: Storage(*v)),
+    ComputationalUnits: float_quantity_args_strategy(["cores", "millicores"]).map(
+        lambda v: ComputationalUnits(*v)
+    ),
+}
+
+
+# Register the previous strategies for our unit types
+st.register_type_strategy(Time, _UNIT_STRATEGIES[Time])
+st.register_type_strategy(Currency, _UNIT_STRATEGIES[Currency])
+st.register_type_strategy(CurrencyPerTime, _UNIT_STRATEGIES[CurrencyPerTime])
+st.register_type_strategy(Requests, _UNIT_STRATEGIES[Requests])
+st.register_type_strategy(RequestsPerTime, _UNIT_STRATEGIES[RequestsPerTime])
+st.register_type_strategy(Storage, _UNIT_STRATEGIES[Storage])
+st.register_type_strategy(ComputationalUnits, _UNIT_STRATEGIES[ComputationalUnits])
+
+
+# Strategy for names which are not inspected by the tests. Short ASCII names are much cheaper to
+# generate and shrink than arbitrary unicode text
+_NAME = st.text(alphabet=string.ascii_letters + string.digits, max_size=8)
+
+# Strategy for workload series. The values are built directly as a tuple, and their number is
+# bounded to keep the examples (and the loops over them in the tests) small. The description and
+# the distribution are only carried through by the model, so they are drawn from small sets
+st.register_type_strategy(
+    model.WorkloadSeries,
+    st.builds(
+        model.WorkloadSeries,
+        description=_NAME,
+        values=st.lists(_UNIT_STRATEGIES[Requests], max_size=8).map(tuple),
+        time_slot_size=_UNIT_STRATEGIES[Time],
+        intra_slot_distribution=st.sampled_from(("uniform", "poisson", "exponential")),
+    ),
+)
 
 
 # Strategy for latencies
 @st.composite
 def model_latency_strategy(draw):
-    latency = draw(str_float_quantity_strategy(["ms"]))
-    return model.Latency(value=Time(latency))
+    latency = draw(float_quantity_args_strategy(["ms"]))
+    return model.Latency(value=Time(*latency))
+
+
+# Strategies for the model types used by model_problem_strategy, resolved only once
+_INSTANCE_CLASS = st.from_type(model.InstanceClass)
+_APP = st.from_type(model.App)
+_REGION = st.from_type(model.Region)
+_COMPUTATIONAL_UNITS = st.from_type(ComputationalUnits)
+_STORAGE = st.from_type(Storage)
+_PERFORMANCE = st.from_type(model.Performance)
+_WORKLOAD_SERIES = st.from_type(model.WorkloadSeries)
+_TIME = st.from_type(Time)
 
 
 @st.composite
@@ -99,48 +137,45 @@ def model_problem_strategy(draw):
     """
 
     # Create a random list of instance classes
-    ics = draw(st.lists(st.from_type(model.InstanceClass), min_size=1, max_size=4))
+    ics = draw(st.lists(_INSTANCE_CLASS, min_size=1, max_size=4))
 
     # Create a random list of apps
-    apps = draw(st.lists(st.from_type(model.App), min_size=1, max_size=4))
+    apps = draw(st.lists(_APP, min_size=1, max_size=4))
 
     # Create a random list of regions
-    regions = draw(st.lists(st.from_type(model.Region), min_size=1, max_size=3))
+    regions = draw(st.lists(_REGION, min_size=1, max_size=3))
 
     # Create a random list of container classes, but ensuring that the app
     # assigned to each cc is drawn from the previous list of apps
 
-    # First we create a list with the parameters to be used to instantate
-    # each ContainerClass, using appropriate strategies for each field
-    ccs_data = draw(
+    # The ContainerClasses are built directly by the strategy, using appropriate strategies for
+    # each field
+    ccs = draw(
         st.lists(
-            st.tuples(
-                st.text(),  # container name
-                st.from_type(ComputationalUnits),  # cores
-                st.from_type(Storage),  # memory
-                st.sampled_from(apps),  # app
-                st.integers(),  # limit
+            st.builds(
+                model.ContainerClass,
+                name=_NAME,
+                cores=_COMPUTATIONAL_UNITS,
+                mem=_STORAGE,
+                app=st.sampled_from(apps),
+                limit=st.integers(),
             ),
             min_size=0,
             max_size=3,
         )
     )
-    # Now instantiate all these ContainerClasses
-    ccs = [
-        model.ContainerClass(name=name, cores=cores, mem=mem, app=app, limit=limit)
-        for (name, cores, mem, app, limit) in ccs_data
-    ]
     # The list may be empty (to allow malloovia models which do not use containers), but for this
     # case `None` has to be used as containerclass key for the performance dict
     if not ccs:
         ccs = [None]
 
     # Create a random dict of performances. The keys of the dict are formed by all combinations of
-    # (ic, cc, app) from the previous list of ics, ccs and apps The values are drawn from strategie
-    # WorkloadSeries
-    perfs = {}
-    for ic, cc, app in itertools.product(ics, ccs, apps):
-        perfs[ic, cc, app] = draw(st.from_type(model.Performance))
+    # (ic, cc, app) from the previous list of ics, ccs and apps. The values are drawn from strategy
+    # Performance, all of them in a single draw of a list. The keys are not materialized, since
+    # itertools.product generates them lazily
+    n_perfs = len(ics) * len(ccs) * len(apps)
+    values = draw(st.lists(_PERFORMANCE, min_size=n_perfs, max_size=n_perfs))
+    perfs = dict(zip(itertools.product(ics, ccs, apps), values))
 
     # Create a random dict for latencies. The keys of the dict are formed by all combinations of
     # regions from the previous list of regions and the values are drawn from strategy Latency
@@ -150,21 +185,48 @@ def model_problem_strategy(draw):
 
     # Create system
     system = model.System(
-        name=draw(st.text()), ics=ics, ccs=ccs, perfs=perfs, latencies=lats
+        name=draw(_NAME), ics=ics, ccs=ccs, perfs=perfs, latencies=lats
     )
     workloads = draw(
         # sample a tuple of (app, region) from the list of apps and regions
         st.dictionaries(
             st.tuples(st.sampled_from(apps), st.sampled_from(regions)),
-            st.from_type(model.WorkloadSeries),
+            _WORKLOAD_SERIES,
         )
     )
 
     # Create the problem with all of the above parameters
     return model.Problem(
-        name=draw(st.text()),
+        name=draw(_NAME),
         system=system,
         workloads=workloads,
-        sched_time_size=draw(st.from_type(Time)),
+        sched_time_size=draw(_TIME),
         version="0.2.0",
     )
+
+
+def _check_problem_consistency(problem: model.Problem) -> model.Problem:
+    """Checks that the sets of ics, ccs and apps inside the problem are consistent"""
+    # Collect the ics, ccs and apps used in the performances in a single pass
+    ics_from_performances = set()
+    ccs_from_performances = set()
+    apps_from_performances = set()
+    for ic, cc, app in problem.system.perfs:
+        ics_from_performances.add(ic)
+        ccs_from_performances.add(cc)
+        apps_from_performances.add(app)
+
+    assert all(
+        c.app in apps_from_performances for c in problem.system.ccs if c is not None
+    )
+    assert all(app in apps_from_performances for app, _region in problem.workloads)
+    assert ics_from_performances <= set(problem.system.ics)
+    assert ccs_from_performances <= set(problem.system.ccs)
+    return problem
+
+
+def valid_problem_strategy():
+    """Strategy to create a random problem as model_problem_strategy does, checking during the
+    generation that the ics, ccs and apps in the problem are consistent, so that tests using it
+    can rely on it"""
+    return model_problem_strategy().map(_check_problem_consistency)
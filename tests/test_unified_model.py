@@ -1,5 +1,9 @@
+import copy
+import pickle
+from dataclasses import dataclass, field
 from typing import Union
 from cloudmodel.unified import model
+from cloudmodel.util import cached_hash, interned
 from pint import DimensionalityError, UndefinedUnitError
 import pytest
 from cloudmodel.unified.units import (
@@ -10,36 +14,39 @@ from cloudmodel.unified.units import (
     RequestsPerTime,
     Storage,
     assert_approx,
+    assert_approx_magnitudes,
+    convert,
+    ureg,
 )
 from hypothesis import HealthCheck, given, reproduce_failure, settings, strategies as st
 
-from .hypothesis_strategies import model_problem_strategy
+from .hypothesis_strategies import valid_problem_strategy
+
+
+# Units to which the normalization tests convert, to compare against them without formatting
+# the units of each quantity as a string
+NORM_UNITS = ("hour", "minute", "second")
+TIME_UNITS = {u: ureg.Unit(u) for u in NORM_UNITS}
+PRICE_UNITS = {u: ureg.Unit(f"usd/{u}") for u in NORM_UNITS}
+PERF_UNITS = {u: ureg.Unit(f"req/{u}") for u in NORM_UNITS}
+
+# Strategy objects are reusable, so the problem strategy is built only once for all tests
+PROBLEM_STRATEGY = valid_problem_strategy()
 
 
 @pytest.mark.property_testing
 class TestPropertyTesting:
-    @given(model_problem_strategy())
+    @given(PROBLEM_STRATEGY)
     @settings(
         max_examples=25, suppress_health_check=[HealthCheck.too_slow], print_blob=True
     )
     def test_model_creation(self, problem: model.Problem):
         """Check that all random problems created by the given strategy can be
-        createwd without errors, and that the set of ics, ccs and apps inside
-        the problem are consistent"""
-        apps_from_workloads = set(app for app, region in problem.workloads)
-        apps_from_performances = set(app for ic, cc, app in problem.system.perfs)
-        apps_from_containers = set(c.app for c in problem.system.ccs if c is not None)
-
-        assert apps_from_containers <= apps_from_performances
-        assert apps_from_workloads <= apps_from_performances
-
-        ics_from_performances = set(ic for ic, cc, app in problem.system.perfs)
-        assert ics_from_performances <= set(problem.system.ics)
+        created without errors. The strategy itself checks that the set of ics, ccs
+        and apps inside the problem are consistent"""
+        assert isinstance(problem, model.Problem)
 
-        ccs_from_performances = set(cc for ic, cc, app in problem.system.perfs)
-        assert ccs_from_performances <= set(problem.system.ccs)
-
-    @given(model_problem_strategy(), st.sampled_from(["hour", "minute", "second"]))
+    @given(PROBLEM_STRATEGY, st.sampled_from(NORM_UNITS))
     @settings(
         max_examples=25, suppress_health_check=[HealthCheck.too_slow], print_blob=True
     )
@@ -48,35 +55,53 @@ class TestPropertyTesting:
         norm = model.normalize_time_units(problem, units=unit)
 
         # Now norm has all the times normalized as minutes, but the
-        # quantities should match (it is neccesary to use assert_approx because
-        # otherwise the == operator may fail due to float rounding errors)
+        # quantities should match (it is neccesary to use an approximate comparison because
+        # otherwise the == operator may fail due to float rounding errors). Since the units of
+        # the normalized quantities are checked, the original quantity is converted to those units
+        # and only the magnitudes are compared
+        time_unit = TIME_UNITS[unit]
+        price_unit = PRICE_UNITS[unit]
+        perf_unit = PERF_UNITS[unit]
 
         # Scheduling interval
-        assert str(norm.sched_time_size.units) == unit
-        assert_approx(norm.sched_time_size, problem.sched_time_size)
+        assert norm.sched_time_size.units == time_unit
+        assert_approx_magnitudes(
+            problem.sched_time_size.to(time_unit).magnitude,
+            norm.sched_time_size.magnitude,
+        )
 
         # Prices
+        assert all(icn.price.units == price_unit for icn in norm.system.ics)
         for ic, icn in zip(problem.system.ics, norm.system.ics):
-            assert str(icn.price.units) == f"usd / {unit}"
-            assert_approx(ic.price, icn.price)
+            assert_approx_magnitudes(
+                ic.price.to(price_unit).magnitude, icn.price.magnitude
+            )
+            assert icn.limiting_sets is ic.limiting_sets
 
         # Performances
-        for perf, perfn in zip(
-            problem.system.perfs.values(), norm.system.perfs.values()
-        ):
-            assert str(perfn.value.units) == f"req / {unit}"
-            assert_approx(perf.value, perfn.value)
-            assert str(perfn.slo95.units) == unit
-            assert_approx(perf.slo95, perfn.slo95)
+        norm_perfs = norm.system.perfs.values()
+        assert all(perfn.value.units == perf_unit for perfn in norm_perfs)
+        assert all(perfn.slo95.units == time_unit for perfn in norm_perfs)
+        for perf, perfn in zip(problem.system.perfs.values(), norm_perfs):
+            assert_approx_magnitudes(
+                perf.value.to(perf_unit).magnitude, perfn.value.magnitude
+            )
+            assert_approx_magnitudes(
+                perf.slo95.to(time_unit).magnitude, perfn.slo95.magnitude
+            )
 
         # Workloads
-        for wl, wln in zip(problem.workloads.values(), norm.workloads.values()):
-            assert str(wln.time_slot_size.units) == unit
-            assert_approx(wl.time_slot_size, wln.time_slot_size)
+        norm_workloads = norm.workloads.values()
+        assert all(wln.time_slot_size.units == time_unit for wln in norm_workloads)
+        for wl, wln in zip(problem.workloads.values(), norm_workloads):
+            assert_approx_magnitudes(
+                wl.time_slot_size.to(time_unit).magnitude,
+                wln.time_slot_size.magnitude,
+            )
 
     @given(
         st.from_type(model.WorkloadSeries),
-        st.sampled_from(["hour", "minute", "second"]),
+        st.sampled_from(NORM_UNITS),
     )
     @settings(
         max_examples=25,
@@ -87,9 +112,9 @@ class TestPropertyTesting:
         scaled = model.workloadSeries_scale(wl_series, to=Time(unit))
         assert scaled.description == wl_series.description
         assert scaled.intra_slot_distribution == wl_series.intra_slot_distribution
-        assert scaled.time_slot_size.units == unit
+        assert scaled.time_slot_size.units == TIME_UNITS[unit]
         assert_approx(scaled.time_slot_size, wl_series.time_slot_size)
-        assert len(scaled.values) == len(wl_series.values)
+        assert scaled.values is wl_series.values
         for wl, wls in zip(scaled.values, wl_series.values):
             assert_approx(wl, wls)
 
@@ -97,34 +122,64 @@ class TestPropertyTesting:
 @pytest.mark.units
 class TestModelUnits:
     @staticmethod
-    def test_bad_dimensionality_in_price():
+    @pytest.mark.parametrize(
+        "cls, bad_input, exc",
+        [
+            (CurrencyPerTime, "20 usd", DimensionalityError),
+            (ComputationalUnits, "2 liter", DimensionalityError),
+            (Storage, "2 cm", DimensionalityError),
+            (CurrencyPerTime, "20 eur / hour", UndefinedUnitError),
+            (RequestsPerTime, "20 req / cm", DimensionalityError),
+        ],
+    )
+    def test_bad_units(cls, bad_input, exc):
         """Trying inappropriate units should raise an exception"""
-        with pytest.raises(DimensionalityError):
-            CurrencyPerTime("20 usd")
+        with pytest.raises(exc):
+            cls(bad_input)
 
     @staticmethod
-    def test_bad_dimensionality_in_cores():
-        """Trying inappropriate units should raise an exception"""
+    def test_magnitude_and_units():
+        assert Time(1.5, "hour") == Time("1.5 hour")
         with pytest.raises(DimensionalityError):
-            ComputationalUnits("2 liter")
+            Time(2, "cm")
 
     @staticmethod
-    def test_bad_dimensionality_in_memory():
-        """Trying inappropriate units should raise an exception"""
+    def test_checked_quantity_is_copied():
+        t = Time("1 h")
+        t2 = Time(t)
+        assert t2 == t
+        t2.ito("minute")
+        assert t.magnitude == 1
+        assert str(t.units) == "hour"
+
+    @staticmethod
+    def test_checked_units_are_per_class():
+        """Units validated for one class should not be accepted by another"""
+        t = Time("1 h")
         with pytest.raises(DimensionalityError):
-            Storage("2 cm")
+            Storage(t)
 
     @staticmethod
-    def test_bad_currency():
-        """Trying inappropriate units should raise an exception"""
-        with pytest.raises(UndefinedUnitError):
-            CurrencyPerTime("20 eur / hour")
+    def test_assert_approx_magnitudes():
+        assert_approx_magnitudes(0.1 + 0.2, 0.3)
+        with pytest.raises(AssertionError):
+            assert_approx_magnitudes(1.0, 1.001)
 
     @staticmethod
-    def test_bad_dimensionality_in_performance():
-        """Trying inappropriate units should raise an exception"""
+    def test_convert():
+        t = Time("90 s")
+        assert convert(t, ureg.Unit("minute")) == t.to("minute")
+        assert convert(t, ureg.Unit("minute")).magnitude == 1.5
         with pytest.raises(DimensionalityError):
-            RequestsPerTime("20 req / cm")
+            convert(t, ureg.Unit("req"))
+
+    @staticmethod
+    def test_convert_to_same_units():
+        t = Time("15 min")
+        converted = convert(t, ureg.Unit("minute"))
+        assert converted == t
+        assert converted.magnitude == 15
+        assert type(converted.magnitude) is int
 
     @staticmethod
     def test_time_conversion():
@@ -148,6 +203,175 @@ class TestModelUnits:
         assert cores.magnitude == 1000
 
 
+# Model classes are only frozen, and so their instances interned, when __debug__ is True
+_only_if_frozen = pytest.mark.skipif(
+    not __debug__, reason="only instances of frozen classes are interned"
+)
+
+
+@pytest.mark.model
+class TestModelClasses:
+    @staticmethod
+    @pytest.mark.skipif(
+        not __debug__, reason="the hash is only cached for frozen classes"
+    )
+    def test_hash_is_cached():
+        ic = model.InstanceClass(
+            name="foo",
+            price=CurrencyPerTime("0.5 usd/h"),
+            cores=ComputationalUnits("2 cores"),
+            mem=Storage("4 GiB"),
+            limit=0,
+            limiting_sets=tuple(),
+        )
+        assert ic._hash is None
+        h = hash(ic)
+        assert ic._hash == h
+        assert hash(ic) == h
+
+    @staticmethod
+    def test_hash_is_not_cached_if_not_frozen():
+        @cached_hash
+        @dataclass(unsafe_hash=True)
+        class Mutable:
+            value: int
+            _hash: int | None = field(
+                default=None, init=False, repr=False, compare=False
+            )
+
+        obj = Mutable(1)
+        h = hash(obj)
+        obj.value = 2
+        assert hash(obj) != h
+        assert obj._hash is None
+
+    @staticmethod
+    def test_not_frozen_classes_are_not_interned():
+        @interned
+        @dataclass
+        class Mutable:
+            value: int
+
+        obj = Mutable(1)
+        assert Mutable(1) is not obj
+        obj.value = 2
+        assert Mutable(1).value == 1
+
+    @staticmethod
+    def test_cached_hash_is_not_pickled():
+        region = model.Region("foo")
+        hash(region)
+        region2 = pickle.loads(pickle.dumps(region))
+        assert region2 == region
+        assert region2._hash is None
+        assert hash(region2) == hash(region)
+
+    @staticmethod
+    @_only_if_frozen
+    def test_apps_are_interned():
+        app = model.App("foo")
+        assert model.App("foo") is app
+        assert model.App(name="foo", max_resp_time=model.UNLIMITED_TIME) is app
+        assert model.App("foo", Time("1 s")) is not app
+        assert model.App("bar") is not app
+        assert pickle.loads(pickle.dumps(app)) is app
+        assert copy.deepcopy(app) is app
+
+    @staticmethod
+    @_only_if_frozen
+    def test_interned_apps_are_not_reinitialized():
+        max_resp_time = Time("10 s")
+        app = model.App("foo", max_resp_time)
+        assert model.App("foo", Time("10 s")) is app
+        assert app.max_resp_time is max_resp_time
+        other = model.App("foo", Time("10.0 s"))
+        assert other is not app
+        assert other == app
+        assert app.max_resp_time.magnitude == 10
+
+    @staticmethod
+    @_only_if_frozen
+    def test_apps_with_other_values_are_interned_if_hashable():
+        # Only the dimensionality of a Time is checked, so other values are accepted as in plain
+        # dataclasses, and interned if they are hashable
+        assert model.App("foo", 1) is model.App("foo", 1)
+        assert model.App("foo", 1) is not model.App("foo", True)
+        app = model.App("foo", [1])
+        assert model.App("foo", [1]) is not app
+        assert model.App("foo", [1]) == app
+
+    @staticmethod
+    @_only_if_frozen
+    def test_limiting_sets_are_interned():
+        ls = model.LimitingSet(name="foo", max_cores=ComputationalUnits("10 cores"))
+        assert (
+            model.LimitingSet(name="foo", max_cores=ComputationalUnits("10 cores"))
+            is ls
+        )
+        assert model.LimitingSet(name="foo") is not ls
+        assert copy.deepcopy(ls) is ls
+
+    @staticmethod
+    @_only_if_frozen
+    def test_interned_limiting_sets_are_not_reinitialized():
+        ls = model.LimitingSet(name="bar", max_vms=1)
+        assert model.LimitingSet(name="bar", max_vms=True) is not ls
+        assert type(ls.max_vms) is int
+        max_cores = ComputationalUnits("10 cores")
+        ls = model.LimitingSet(name="bar", max_cores=max_cores)
+        assert model.LimitingSet(name="bar", max_cores=max_cores) is ls
+        assert (
+            model.LimitingSet(name="bar", max_cores=ComputationalUnits("10.0 cores"))
+            is not ls
+        )
+        assert ls.max_cores is max_cores
+
+    @staticmethod
+    def test_system_stores_tuples():
+        sys = model.System(name="foo", ics=[], ccs=[], perfs={}, latencies={})
+        assert sys.ics == ()
+        assert sys.ccs == ()
+
+    @staticmethod
+    def test_system_perfs_indexes():
+        ics = [
+            model.InstanceClass(
+                name=name,
+                price=CurrencyPerTime("0.5 usd/h"),
+                cores=ComputationalUnits("2 cores"),
+                mem=Storage("4 GiB"),
+                limit=0,
+                limiting_sets=tuple(),
+            )
+            for name in ("ic0", "ic1")
+        ]
+        apps = [model.App("app0"), model.App("app1")]
+        perfs = {}
+        for ic in ics:
+            for app in apps:
+                perfs[ic, None, app] = model.Performance(
+                    value=RequestsPerTime(f"{len(perfs)} req/s"), slo95=Time("1 s")
+                )
+        sys = model.System(name="foo", ics=ics, ccs=[], perfs=perfs, latencies={})
+
+        assert sys.perfs_for_ic(ics[1]) == {
+            (None, app): perfs[ics[1], None, app] for app in apps
+        }
+        assert sys.perfs_for_app(apps[0]) == {
+            (ic, None): perfs[ic, None, apps[0]] for ic in ics
+        }
+        assert sys.perfs_for_app(model.App("other")) == {}
+
+    @staticmethod
+    def test_workloadSeries_scaling_same_units():
+        wl_series = model.WorkloadSeries(
+            description="foo",
+            values=(Requests("1 req"), Requests("2 req")),
+            time_slot_size=Time("1 hour"),
+        )
+        assert model.workloadSeries_scale(wl_series, to=Time("hour")) is wl_series
+
+
 @pytest.mark.repr
 class TestRepresentation:
     @staticmethod
@@ -165,6 +389,26 @@ class TestRepresentation:
         a = model.Latency(Time("10ms"))
         assert repr(a) == "Latency(value='10 millisecond')"
 
+    @staticmethod
+    def test_repr_follows_default_format():
+        a = model.Latency(Time("10ms"))
+        assert repr(a) == "Latency(value='10 millisecond')"
+        previous_format = ureg.default_format
+        ureg.default_format = "~"
+        try:
+            assert repr(a) == "Latency(value='10 ms')"
+        finally:
+            ureg.default_format = previous_format
+        assert repr(a) == "Latency(value='10 millisecond')"
+
+    @staticmethod
+    def test_repr_follows_quantity_format():
+        t = Time("1.0 hour")
+        assert repr(model.Latency(t)) == "Latency(value='1.0 hour')"
+        t.default_format = "~"
+        assert repr(model.Latency(t)) == "Latency(value='1.0 h')"
+        assert repr(model.Latency(Time("1.0 hour"))) == "Latency(value='1.0 hour')"
+
     @staticmethod
     def test_repr_wl_series():
         wls = model.WorkloadSeries(